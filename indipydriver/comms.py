@@ -1,10 +1,8 @@
 
-import asyncio, sys, os, time
+import asyncio, sys, os, time, stat, re
 
 import xml.etree.ElementTree as ET
 
-import fcntl
-
 import logging
 logger = logging.getLogger(__name__)
 
@@ -31,33 +29,127 @@ TAGS = (b'getProperties',
        )
 
 
-# _STARTTAGS is a tuple of ( b'<defTextVector', ...  ) data received will be tested to start with such a starttag
-_STARTTAGS = tuple(b'<' + tag for tag in TAGS)
-
-
 # _ENDTAGS is a tuple of ( b'</defTextVector>', ...  ) data received will be tested to end with such an endtag
 _ENDTAGS = tuple(b'</' + tag + b'>' for tag in TAGS)
 
+# _TAGINDEX is a dictionary of {b'defTextVector':index, ...} where index is the position of the tag in TAGS
+_TAGINDEX = {tag:index for index, tag in enumerate(TAGS)}
+
+# _STARTSEARCH finds the first recognised start tag, being < followed by one
+# of the TAGS, and then whitespace, / or >
+_STARTSEARCH = re.compile(b'<(' + b'|'.join(re.escape(tag) for tag in TAGS) + rb')[\s/>]').search
+
+
+def _findstart(data, start=0):
+    """Returns (position, index) of the first recognised start tag in data, searching
+       from position start, where index is the position of the tag in TAGS,
+       or (-1, None) if not found"""
+    match = _STARTSEARCH(data, start)
+    if match is None:
+        return -1, None
+    return match.start(), _TAGINDEX[match.group(1)]
+
+
+
+def _escape(value):
+    "Escapes an xml attribute value, in the same manner as ElementTree"
+    if "&" in value:
+        value = value.replace("&", "&amp;")
+    if "<" in value:
+        value = value.replace("<", "&lt;")
+    if ">" in value:
+        value = value.replace(">", "&gt;")
+    if "\"" in value:
+        value = value.replace("\"", "&quot;")
+    if "\r" in value:
+        value = value.replace("\r", "&#13;")
+    if "\n" in value:
+        value = value.replace("\n", "&#10;")
+    if "\t" in value:
+        value = value.replace("\t", "&#09;")
+    return value
 
 
 def _makestart(element):
-    "Given an xml element, returns a string of its start, including < tag attributes >"
+    """Given an xml element, returns bytes of its start, including < tag attributes >
+       encoded as ET.tostring would encode it"""
     attriblist = ["<", element.tag]
     for key,value in element.attrib.items():
-        attriblist.append(f" {key}=\"{value}\"")
+        attriblist.append(f" {key}=\"{_escape(value)}\"")
     attriblist.append(">")
-    return "".join(attriblist)
+    return "".join(attriblist).encode("us-ascii", "xmlcharrefreplace")
 
 
-async def queueget(queue, timeout=0.5):
-    """"Returns True, True if timed out
-                True, False is reserved for future
-                False, Value if a value is taken from the queue"""
+def tobytes(element):
+    """Returns the xml element as bytes. Elements without children or text, such as
+       message and getProperties, are formatted directly, which is quicker than ET.tostring"""
+    if len(element) or element.text:
+        return ET.tostring(element)
+    attriblist = ["<", element.tag]
+    for key,value in element.attrib.items():
+        attriblist.append(f" {key}=\"{_escape(value)}\"")
+    attriblist.append(" />")
+    return "".join(attriblist).encode("us-ascii", "xmlcharrefreplace")
+
+
+def logstring(element):
+    """Returns the xml element as a string for debug logging, the contents of
+       any BLOB members are replaced by NOT LOGGED. Only the member elements are
+       rebuilt for this, so large BLOB contents are not copied."""
+    if (element.tag == "setBLOBVector" or element.tag == "newBLOBVector") and len(element):
+        data = ET.Element(element.tag, element.attrib)
+        for member in element:
+            ET.SubElement(data, member.tag, member.attrib).text = "NOT LOGGED"
+        element = data
+    return ET.tostring(element, encoding="unicode")
+
+
+def wakeque(queue):
+    """Puts the sentinel value None into the queue, which wakes a coroutine
+       waiting on the queue so it can check its stop flag. If the queue is
+       full the coroutine is not waiting, so nothing needs to be added."""
     try:
-        value = await asyncio.wait_for(queue.get(), timeout)
-    except asyncio.TimeoutError:
-        return True, True
-    return False, value
+        queue.put_nowait(None)
+    except asyncio.QueueFull:
+        pass
+
+
+class MessageParser:
+    """Parses complete messages, as delimited by _xmlinput, using a single
+       long lived XMLPullParser rather than creating a new parser for every
+       message. The messages are fed in as children of a synthetic <indi>
+       element, which is cleared after each message is parsed."""
+
+    def __init__(self):
+        self._newparser()
+
+    def _newparser(self):
+        "Creates the pull parser, and records the synthetic root element"
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._parser.feed(b'<indi>')
+        for event, self._root in self._parser.read_events():
+            pass
+
+    def parse(self, message):
+        """Returns the element parsed from message, which should be one complete
+           xml element. Raises ET.ParseError if the message cannot be parsed,
+           in which case a new parser is created for the following messages."""
+        root = self._root
+        event = element = None
+        try:
+            self._parser.feed(message)
+            for event, element in self._parser.read_events():
+                pass
+        except ET.ParseError:
+            self._newparser()
+            raise
+        if event != 'end' or len(root) != 1 or element is not root[0]:
+            # the message has not completed a single element, for example
+            # it has an unterminated attribute, so the parser state is unusable
+            self._newparser()
+            raise ET.ParseError("Message is not a single complete element")
+        root.clear()
+        return element
 
 
 class STDOUT_TX:
@@ -65,9 +157,13 @@ class STDOUT_TX:
 
     def __init__(self):
         self._stop = False       # Gets set to True to stop communications
+        self._writerque = None   # Set by run_tx, so shutdown can wake it
+        self.writer = None       # Set to an asyncio.StreamWriter if stdout is a pipe
 
     def shutdown(self):
         self._stop = True
+        if self._writerque is not None:
+            wakeque(self._writerque)
 
     @property
     def stop(self):
@@ -75,48 +171,66 @@ class STDOUT_TX:
         return self._stop
 
 
+    async def _write(self, fd, buffers):
+        """Writes the list of bytes objects in buffers to file descriptor fd,
+           using a single os.writev call where possible"""
+        if self.writer is not None:
+            # stdout is connected to the event loop, drain waits, without
+            # blocking the loop, while the receiver is slow to read
+            self.writer.writelines(buffers)
+            await self.writer.drain()
+            return
+        if not hasattr(os, "writev"):
+            sys.stdout.buffer.write(b"".join(buffers))
+            sys.stdout.buffer.flush()
+            return
+        while buffers:
+            try:
+                written = os.writev(fd, buffers)
+            except BlockingIOError:
+                # stdout may share a non-blocking file with stdin
+                await asyncio.sleep(0.02)
+                continue
+            # remove the buffers which have been written, and
+            # on a partial write, keep the remainder
+            while buffers and written >= len(buffers[0]):
+                written -= len(buffers.pop(0))
+            if written:
+                buffers[0] = memoryview(buffers[0])[written:]
+
+
     async def run_tx(self, writerque):
         """Gets data from writerque, and transmits it out on stdout"""
+        # ensure nothing is left in the stdout buffer, as data is written directly to the file descriptor
+        sys.stdout.buffer.flush()
+        fd = sys.stdout.fileno()
+        self._writerque = writerque
         while not self._stop:
-            await asyncio.sleep(0)
-            # get block of data from writerque and transmit down stdout
-            quexit, txdata = await queueget(writerque)
-            if quexit:
-                continue
+            # get block of data from writerque and transmit down stdout,
+            # this waits, yielding to other tasks, while the queue is empty
+            txdata = await writerque.get()
             writerque.task_done()
             if txdata is None:
-                await asyncio.sleep(0.02)
+                # sentinel value, check the stop flag
                 continue
             if (txdata.tag == "setBLOBVector") and len(txdata):
                 # txdata is a setBLOBVector containing blobs
                 # send initial setBLOBVector
-                startdata = _makestart(txdata)
-                sys.stdout.buffer.write(startdata.encode())
-                sys.stdout.buffer.flush()
+                buffers = [_makestart(txdata)]
                 for oneblob in txdata.iter('oneBLOB'):
-                    bytescontent = oneblob.text.encode()
-                    # send start of oneblob
-                    startoneblob = _makestart(oneblob)
-                    sys.stdout.buffer.write(startoneblob.encode())
-                    sys.stdout.buffer.flush()
-                    # send content in chunks
-                    chunksize = 1000
-                    for b in range(0, len(bytescontent), chunksize):
-                        byteschunk = bytescontent[b:b+chunksize]
-                        sys.stdout.buffer.write(byteschunk)
-                        sys.stdout.buffer.flush()
-                        await asyncio.sleep(0)
-                    sys.stdout.buffer.write(b"</oneBLOB>")
-                    sys.stdout.buffer.flush()
+                    # send start of oneblob, its content and end, in one call
+                    buffers.append(_makestart(oneblob))
+                    buffers.append(oneblob.text.encode())
+                    buffers.append(b"</oneBLOB>")
+                    await self._write(fd, buffers)
+                    buffers = []
+                    await asyncio.sleep(0)
                 # send enddata
-                sys.stdout.buffer.write(b"</setBLOBVector>\n")
-                sys.stdout.buffer.flush()
+                buffers.append(b"</setBLOBVector>\n")
+                await self._write(fd, buffers)
             else:
                 # its straight xml, send it out on stdout
-                binarydata = ET.tostring(txdata)
-                binarydata += b"\n"
-                sys.stdout.buffer.write(binarydata)
-                sys.stdout.buffer.flush()
+                await self._write(fd, [tobytes(txdata), b"\n"])
 
 
 class STDIN_RX:
@@ -124,11 +238,18 @@ class STDIN_RX:
        and passes it to the driver by appending it to the driver's readerque"""
 
     def __init__(self):
-        self._remainder = b""    # Used to store intermediate data
+        self._remainder = bytearray()  # Used to store intermediate data
+        self._position = 0       # Position in self._remainder of data not yet framed
         self._stop = False       # Gets set to True to stop communications
+        self._parser = MessageParser()  # Parses each received message
+        self.reader = None       # Set to an asyncio.StreamReader if stdin is a pipe
+        self._rxtask = None      # The task running run_rx, cancelled on shutdown
 
     def shutdown(self):
         self._stop = True
+        if self._rxtask is not None:
+            # run_rx may be waiting for data, or for space in the readerque
+            self._rxtask.cancel()
 
     @property
     def stop(self):
@@ -137,6 +258,7 @@ class STDIN_RX:
 
     async def run_rx(self, readerque):
         "pass data to readerque"
+        self._rxtask = asyncio.current_task()
         try:
             # get block of xml.etree.ElementTree data
             # from self._xmlinput and append it to readerque
@@ -144,107 +266,117 @@ class STDIN_RX:
                 rxdata = await self._xmlinput()
                 if rxdata is None:
                     return
-                # append it to readerque
-                while not self._stop:
-                    try:
-                        await asyncio.wait_for(readerque.put(rxdata), timeout=0.5)
-                    except asyncio.TimeoutError:
-                        # queue is full, continue while loop, checking stop flag
-                        continue
-                    # rxdata is now in readerque, break the inner while loop
-                    break
+                # append it to readerque, if the queue is full, this waits
+                # for space, or until the task is cancelled by shutdown
+                try:
+                    readerque.put_nowait(rxdata)
+                except asyncio.QueueFull:
+                    await readerque.put(rxdata)
+        except asyncio.CancelledError:
+            # shutdown cancels this task, propogate the
+            # CancelledError only if it is not due to self._stop
+            if not self._stop:
+                raise
         except Exception:
             logger.exception("Exception report from STDIN_RX.run_rx")
             raise
 
     async def _xmlinput(self):
-        """get data from  _datainput, parse it, and return it as xml.etree.ElementTree object
+        """get data from stdin or the port, parse it, and return it as xml.etree.ElementTree object
            Returns None if stop flags arises"""
-        message = b''
-        messagetagnumber = None
+        # received blocks of data are accumulated in self._remainder, a bytearray,
+        # which may hold several messages, or part of a message. Messages are
+        # framed by their positions in the buffer, and the data already framed
+        # is only removed from the buffer when more data is needed
+        buffer = self._remainder
+        start = self._position   # position of the data not yet framed
+        endtag = None            # the endtag of the message starting at start
+        tagend = -1              # position of the > ending the message start tag
+        searchfrom = 0           # position from which to search for the endtag
+        # local names for the functions and constants used in the loop
+        datainput = self._datainput if self.reader is None else self._readerinput
+        parse = self._parser.parse
+        findstart = _findstart
+        endtags = _ENDTAGS
         while not self._stop:
-            await asyncio.sleep(0)
-            data = await self._datainput()
-            # data is either None, or binary data ending in b">"
+            if endtag is None:
+                positionofst, messagetagnumber = findstart(buffer, start)
+                if positionofst == -1:
+                    # the buffer does not contain a recognised tag, so ignore it,
+                    # apart from a final part tag, which may be completed by more data
+                    lt = buffer.rfind(b"<", start)
+                    start = len(buffer) if lt == -1 else lt
+                else:
+                    # a message starts at positionofst, any preceding newlines
+                    # or other characters are discarded
+                    start = positionofst
+                    endtag = endtags[messagetagnumber]
+                    tagend = -1
+            if endtag is not None:
+                if tagend == -1:
+                    tagend = buffer.find(b">", start)
+                    searchfrom = tagend + 1
+                if tagend != -1:
+                    if buffer[tagend-1] == 47:
+                        # the message is a single tag ending in "/>"
+                        end = tagend + 1
+                    else:
+                        end = buffer.find(endtag, searchfrom)
+                        if end == -1:
+                            # the endtag has not been received yet, a further search
+                            # need only cover the end of this data, and the new data
+                            searchfrom = max(searchfrom, len(buffer) - len(endtag) + 1)
+                        else:
+                            end += len(endtag)
+                    if end != -1:
+                        # the message is complete, handle message here
+                        message = buffer[start:end]
+                        start = end
+                        endtag = None
+                        try:
+                            root = parse(message)
+                        except Exception as e:
+                            # failed to parse the message, continue with the next
+                            continue
+                        # record where the next call continues framing
+                        self._position = start
+                        # xml datablock done, return it
+                        return root
+            # more data is needed, first remove the data already framed
+            if start:
+                del buffer[:start]
+                if tagend != -1:
+                    tagend -= start
+                    searchfrom -= start
+                start = 0
+                self._position = 0
+            data = await datainput()
             if data is None:
                 return
             if self._stop:
                 return
-            if not message:
-                # data is expected to start with <tag, first strip any newlines
-                data = data.strip()
-                for index, st in enumerate(_STARTTAGS):
-                    if data.startswith(st):
-                        messagetagnumber = index
-                        break
-                    elif st in data:
-                        # remove any data prior to a starttag
-                        positionofst = data.index(st)
-                        data = data[positionofst:]
-                        messagetagnumber = index
-                        break
-                else:
-                    # data does not start with a recognised tag, so ignore it
-                    # and continue waiting for a valid message start
-                    continue
-                # set this data into the received message
-                message = data
-                # either further children of this tag are coming, or maybe its a single tag ending in "/>"
-                if message.endswith(b'/>'):
-                    # the message is complete, handle message here
-                    try:
-                        root = ET.fromstring(message.decode("us-ascii"))
-                    except Exception as e:
-                        # failed to parse the message, continue at beginning
-                        message = b''
-                        messagetagnumber = None
-                        continue
-                    # xml datablock done, return it
-                    return root
-                # and read either the next message, or the children of this tag
-                continue
-            # To reach this point, the message is in progress, with a messagetagnumber set
-            # keep adding the received data to message, until an endtag is reached
-            message += data
-            if message.endswith(_ENDTAGS[messagetagnumber]):
-                # the message is complete, handle message here
-                try:
-                    root = ET.fromstring(message.decode("us-ascii"))
-                except Exception as e:
-                    # failed to parse the message, continue at beginning
-                    message = b''
-                    messagetagnumber = None
-                    continue
-                # xml datablock done, return it
-                return root
-            # so message is in progress, with a messagetagnumber set
-            # but no valid endtag received yet, so continue the loop
-
+            buffer += data
 
     async def _datainput(self):
-        """Waits for binary string of data ending in > from stdin
-           Returns None if stop flags arises"""
-        remainder = self._remainder
-        if b">" in remainder:
-            # This returns with binary data ending in > as long
-            # as there are > characters in self._remainder
-            binarydata, self._remainder = remainder.split(b'>', maxsplit=1)
-            binarydata += b">"
-            return binarydata
-        # As soon as there are no > characters left in self._remainder
-        # get more data from stdin
-        while not self._stop:
-            await asyncio.sleep(0)
-            indata = sys.stdin.buffer.read(100)
-            if not indata:
-                await asyncio.sleep(0.02)
-                continue
-            remainder += indata
-            if b">" in indata:
-                binarydata, self._remainder = remainder.split(b'>', maxsplit=1)
-                binarydata += b">"
-                return binarydata
+        """Returns a block of data read from stdin, used where stdin is a
+           redirected file. Returns None at the end of the file"""
+        # reading a file does not block, so yield to other tasks
+        await asyncio.sleep(0)
+        data = sys.stdin.buffer.read(65536)
+        if not data:
+            # end of file
+            return
+        return data
+
 
+    async def _readerinput(self):
+        """Waits for a block of data from self.reader
+           Returns None at the end of file"""
+        data = await self.reader.read(65536)
+        if not data:
+            # end of file
+            return
+        return data
 
 
 class STDINOUT():
@@ -270,15 +402,43 @@ class STDINOUT():
 
     async def __call__(self, readerque, writerque):
         "Called from indipydriver.asyncrun() to run the communications"
-        # Set stdin to non-blocking mode
-        flags = fcntl.fcntl(sys.stdin.fileno(), fcntl.F_GETFL)
-        fcntl.fcntl(sys.stdin.fileno(), fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        fd = sys.stdin.fileno()
+        mode = os.fstat(fd).st_mode
+        blocking = os.get_blocking(fd)
+        if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or os.isatty(fd):
+            # stdin is a pipe or socket, as normally set up by an INDI server,
+            # or a terminal, so connect it to the event loop, which sets it
+            # to non-blocking mode, and data is read as it arrives
+            loop = asyncio.get_running_loop()
+            reader = asyncio.StreamReader()
+            protocol = asyncio.StreamReaderProtocol(reader)
+            await loop.connect_read_pipe(lambda: protocol, sys.stdin)
+            self.rx.reader = reader
+        # otherwise stdin is a redirected file, which is read directly
+
+        outfd = sys.stdout.fileno()
+        outmode = os.fstat(outfd).st_mode
+        outblocking = os.get_blocking(outfd)
+        if stat.S_ISFIFO(outmode) or stat.S_ISSOCK(outmode):
+            # stdout is a pipe or socket, so connect it to the event loop, then
+            # a slow receiver does not block the loop while data is written
+            sys.stdout.flush()
+            loop = asyncio.get_running_loop()
+            transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+            self.tx.writer = asyncio.StreamWriter(transport, protocol, None, loop)
+        # otherwise stdout is a terminal or a file, written directly
 
         logger.info("Communicating via STDIN/STDOUT")
-
-        await asyncio.gather(self.rx.run_rx(readerque),
-                             self.tx.run_tx(writerque)
-                             )
+        try:
+            await asyncio.gather(self.rx.run_rx(readerque),
+                                 self.tx.run_tx(writerque)
+                                 )
+        finally:
+            # do not leave a shared terminal, or a pipe, in non-blocking mode
+            if blocking:
+                os.set_blocking(fd, True)
+            if outblocking:
+                os.set_blocking(outfd, True)
 
 class Port_TX():
     "An object that transmits data on a port, used by Portcomms as one half of the communications path"
@@ -287,6 +447,7 @@ class Port_TX():
         self.sendchecker = sendchecker
         self.writer = writer
         self._stop = False       # Gets set to True to stop communications
+        self._writerque = None   # Set by run_tx, so shutdown can wake it
 
     @property
     def stop(self):
@@ -295,26 +456,48 @@ class Port_TX():
 
     def shutdown(self):
         self._stop = True
+        if self._writerque is not None:
+            wakeque(self._writerque)
 
     async def run_tx(self, writerque):
-        """Gets data from writerque, and transmits it out on the port writer"""
+        """Gets data from writerque, and transmits it out on the port writer.
+           The data is an xml element, or a tuple of (element, bytes) where
+           the bytes are the element already serialised, as placed by IPyServer
+           so a message sent to several clients is only serialised once"""
+        self._writerque = writerque
         while not self._stop:
-            await asyncio.sleep(0)
-            # get block of data from writerque and transmit
-            quexit, txdata = await queueget(writerque)
-            if quexit:
-                continue
+            # get block of data from writerque and transmit, this
+            # waits, yielding to other tasks, while the queue is empty
+            txdata = await writerque.get()
             writerque.task_done()
-            if txdata is None:
-                continue
-            if not self.sendchecker.allowed(txdata):
-                # this data should not be transmitted, discard it
-                continue
-            # this data can be transmitted
-            binarydata = ET.tostring(txdata)
-            # Send to the port
-            self.writer.write(binarydata)
-            await self.writer.drain()
+            # any further data already waiting in the queue is sent with
+            # this, in a single write and drain, up to about 64KiB
+            buffers = []
+            size = 0
+            while True:
+                if txdata is not None:
+                    if type(txdata) is tuple:
+                        txdata, binarydata = txdata
+                    else:
+                        binarydata = None
+                    if self.sendchecker.allowed(txdata):
+                        # this data can be transmitted
+                        if binarydata is None:
+                            binarydata = tobytes(txdata)
+                        buffers.append(binarydata)
+                        size += len(binarydata)
+                # a txdata of None is a sentinel value, so check the stop flag
+                if self._stop or size >= 65536:
+                    break
+                try:
+                    txdata = writerque.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                writerque.task_done()
+            if buffers:
+                # Send to the port
+                self.writer.writelines(buffers)
+                await self.writer.drain()
         self.writer.close()
         await self.writer.wait_closed()
 
@@ -332,25 +515,30 @@ class Port_RX(STDIN_RX):
 
     async def run_rx(self, readerque):
         "pass xml.etree.ElementTree data to readerque"
+        self._rxtask = asyncio.current_task()
         try:
             # get block of xml.etree.ElementTree data
             # from self._xmlinput and append it to  readerque
             while not self._stop:
                 rxdata = await self._xmlinput()
                 if rxdata is None:
-                    return
+                    if self._stop:
+                        return
+                    # the connection has been closed by the client
+                    raise ConnectionError("Connection closed by the client")
                 if rxdata.tag == "enableBLOB":
                     # set permission flags in the sendchecker object
                     self.sendchecker.setpermissions(rxdata)
-                # and place rxdata into readerque
-                while not self._stop:
-                    try:
-                        await asyncio.wait_for(readerque.put(rxdata), timeout=0.5)
-                    except asyncio.TimeoutError:
-                        # queue is full, continue while loop, checking stop flag
-                        continue
-                    # rxdata is now in readerque, break the inner while loop
-                    break
+                # and place rxdata into readerque, if the queue is full, this
+                # waits for space, or until the task is cancelled by shutdown
+                try:
+                    readerque.put_nowait(rxdata)
+                except asyncio.QueueFull:
+                    await readerque.put(rxdata)
+        except asyncio.CancelledError:
+            # propogate the CancelledError only if it is not due to self._stop
+            if not self._stop:
+                raise
         except ConnectionError:
             # re-raise this without creating a report, as it probably indicates
             # a normal connection drop
@@ -361,32 +549,6 @@ class Port_RX(STDIN_RX):
             raise
 
 
-    async def _datainput(self):
-        """Waits for binary string of data ending in > from the port
-           Returns None if stop flags arises"""
-        binarydata = b""
-        while not self._stop:
-            await asyncio.sleep(0)
-            try:
-                data = await self.reader.readuntil(separator=b'>')
-            except asyncio.LimitOverrunError:
-                data = await self.reader.read(n=32000)
-            except asyncio.IncompleteReadError:
-                binarydata = b""
-                await asyncio.sleep(0.1)
-                continue
-            if not data:
-                await asyncio.sleep(0.1)
-                continue
-            # data received
-            if b">" in data:
-                binarydata = binarydata + data
-                return binarydata
-            # data has content but no > found
-            binarydata += data
-            # could put a max value here to stop this increasing indefinetly
-
-
 class Portcomms():
     """If indipydriver.comms is set to an instance of this class it is
        used to implement communications via a port"""
@@ -459,10 +621,8 @@ class Portcomms():
             rxtask.cancel()
         cleanque(self.writerque)
         logger.info(f"Connection from {addr} closed")
-        while True:
-            if txtask.done() and rxtask.done():
-                break
-            await asyncio.sleep(1)
+        # wait for both tasks to finish their cancellation
+        await asyncio.gather(txtask, rxtask, return_exceptions=True)
 
 
 def cleanque(que):
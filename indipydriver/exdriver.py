@@ -1,12 +1,12 @@
 
-import asyncio, copy
+import asyncio, re
 
 import xml.etree.ElementTree as ET
 
 import logging
 logger = logging.getLogger(__name__)
 
-from .comms import queueget
+from .comms import wakeque, tobytes, MessageParser, logstring
 
 
 # All xml data sent from the driver should be contained in one of the following tags
@@ -25,19 +25,33 @@ TAGS = (b'message',
         b'getProperties'       # for snooping
        )
 
-DEFTAGS = ( 'defSwitchVector',
-            'defLightVector',
-            'defTextVector',
-            'defNumberVector',
-            'defBLOBVector'
-          )
-
-# _STARTTAGS is a tuple of ( b'<defTextVector', ...  ) data received will be tested to start with such a starttag
-_STARTTAGS = tuple(b'<' + tag for tag in TAGS)
+DEFTAGS = frozenset(( 'defSwitchVector',
+                      'defLightVector',
+                      'defTextVector',
+                      'defNumberVector',
+                      'defBLOBVector'
+                   ))
 
 # _ENDTAGS is a tuple of ( b'</defTextVector>', ...  ) data received will be tested to end with such an endtag
 _ENDTAGS = tuple(b'</' + tag + b'>' for tag in TAGS)
 
+# _TAGINDEX is a dictionary of {b'defTextVector':index, ...} where index is the position of the tag in TAGS
+_TAGINDEX = {tag:index for index, tag in enumerate(TAGS)}
+
+# _STARTSEARCH finds the first recognised start tag, being < followed by one
+# of the TAGS, and then whitespace, / or >
+_STARTSEARCH = re.compile(b'<(' + b'|'.join(re.escape(tag) for tag in TAGS) + rb')[\s/>]').search
+
+
+def _findstart(data, start=0):
+    """Returns (position, index) of the first recognised start tag in data, searching
+       from position start, where index is the position of the tag in TAGS,
+       or (-1, None) if not found"""
+    match = _STARTSEARCH(data, start)
+    if match is None:
+        return -1, None
+    return match.start(), _TAGINDEX[match.group(1)]
+
 
 class ExVector:
 
@@ -72,15 +86,23 @@ class ExDriver:
         self.snoopdevices = set()       # gets set to a set of device names
         self.snoopvectors = set()       # gets set to a set of (devicename,vectorname) tuples
 
-        self._remainder = b""    # Used to store intermediate data
+        self._remainder = bytearray()  # Used to store intermediate data
+        self._position = 0       # Position in self._remainder of data not yet framed
+        self._parser = MessageParser()  # Parses each received message
         self._stop = False       # Gets set to True to stop communications
+        self._txtask = None      # The task running _run_tx, cancelled on shutdown
 
     def shutdown(self):
         self._stop = True
         if not self.proc is None:
             self.proc.terminate()
+        if self._txtask is not None:
+            # _run_tx may be waiting for data, or for space in the writerque
+            self._txtask.cancel()
         if not self.comms is None:
             self.comms.shutdown()
+        # wake _run_rx, so it can check self._stop
+        wakeque(self.readerque)
 
 
     def __contains__(self, item):
@@ -103,24 +125,15 @@ class ExDriver:
             break
         while not self._stop:
             # get block of data from readerque
-            quexit, rxdata = await queueget(self.readerque)
-            if quexit:
-                continue
+            rxdata = await self.readerque.get()
             self.readerque.task_done()
             if rxdata is None:
                 # A sentinal value, check self._stop
                 continue
-            binarydata = ET.tostring(rxdata)
+            binarydata = tobytes(rxdata)
             # log the received data
-            if logger.isEnabledFor(logging.DEBUG) and self.debug_enable:
-                if ((rxdata.tag == "setBLOBVector") or (rxdata.tag == "newBLOBVector")) and len(rxdata):
-                    data = copy.deepcopy(rxdata)
-                    for element in data:
-                        element.text = "NOT LOGGED"
-                    binstring = ET.tostring(data)
-                    logger.debug(f"RX:: {binstring.decode('utf-8')}")
-                else:
-                    logger.debug(f"RX:: {binarydata.decode('utf-8')}")
+            if self.debug_enable and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("RX:: %s", logstring(rxdata))
             binarydata += b"\n"
             self.proc.stdin.write(binarydata)
             await self.proc.stdin.drain()
@@ -128,6 +141,7 @@ class ExDriver:
 
     async def _run_tx(self):
         "Get data from driver and pass into writerque towards the server"
+        self._txtask = asyncio.current_task()
         try:
             # get block of xml.etree.ElementTree data
             # from self._xmlinput and append it to self.writerque
@@ -155,25 +169,21 @@ class ExDriver:
                         self.snoopdevices.add(devicename)
                     else:
                         self.snoopvectors.add((devicename,vectorname))
-                # append it to  writerque
-                while not self._stop:
-                    try:
-                        await asyncio.wait_for(self.writerque.put(txdata), timeout=0.5)
-                    except asyncio.TimeoutError:
-                        # queue is full, continue while loop, checking stop flag
-                        continue
-                    # txdata is now in writerque, break the inner while loop
-                    break
-                if logger.isEnabledFor(logging.DEBUG) and self.debug_enable:
-                    if (txdata.tag == "setBLOBVector") and len(txdata):
-                        data = copy.deepcopy(txdata)
-                        for element in data:
-                            element.text = "NOT LOGGED"
-                        binarydata = ET.tostring(data)
-                        logger.debug(f"TX:: {binarydata.decode('utf-8')}")
-                    else:
-                        binarydata = ET.tostring(txdata)
-                        logger.debug(f"TX:: {binarydata.decode('utf-8')}")
+                # append it to writerque, if the queue is full, this waits for
+                # space, during which the driver output is not read, so the
+                # pipe from the driver fills and applies backpressure to it.
+                # The wait ends when space is available, or the task is cancelled by shutdown
+                try:
+                    self.writerque.put_nowait(txdata)
+                except asyncio.QueueFull:
+                    await self.writerque.put(txdata)
+                if self.debug_enable and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("TX:: %s", logstring(txdata))
+        except asyncio.CancelledError:
+            # shutdown cancels this task, propogate the
+            # CancelledError only if it is not due to self._stop
+            if not self._stop:
+                raise
         except Exception:
             logger.exception("Exception report from ExDriver._run_tx")
             raise
@@ -182,100 +192,97 @@ class ExDriver:
     async def _xmlinput(self):
         """get data from driver, parse it, and return it as xml.etree.ElementTree object
            Returns None if stop flags arises"""
-        message = b''
-        messagetagnumber = None
+        # received blocks of data are accumulated in self._remainder, a bytearray,
+        # which may hold several messages, or part of a message. Messages are
+        # framed by their positions in the buffer, and the data already framed
+        # is only removed from the buffer when more data is needed
+        buffer = self._remainder
+        start = self._position   # position of the data not yet framed
+        endtag = None            # the endtag of the message starting at start
+        tagend = -1              # position of the > ending the message start tag
+        searchfrom = 0           # position from which to search for the endtag
+        # local names for the functions and constants used in the loop
+        datainput = self._datainput
+        parse = self._parser.parse
+        findstart = _findstart
+        endtags = _ENDTAGS
         while not self._stop:
-            data = await self._datainput()
-            # data is either None, or binary data ending in b">"
+            if endtag is None:
+                positionofst, messagetagnumber = findstart(buffer, start)
+                if positionofst == -1:
+                    # the buffer does not contain a recognised tag, so ignore it,
+                    # apart from a final part tag, which may be completed by more data
+                    lt = buffer.rfind(b"<", start)
+                    start = len(buffer) if lt == -1 else lt
+                else:
+                    # a message starts at positionofst, any preceding newlines
+                    # or other characters are discarded
+                    start = positionofst
+                    endtag = endtags[messagetagnumber]
+                    tagend = -1
+            if endtag is not None:
+                if tagend == -1:
+                    tagend = buffer.find(b">", start)
+                    searchfrom = tagend + 1
+                if tagend != -1:
+                    if buffer[tagend-1] == 47:
+                        # the message is a single tag ending in "/>"
+                        end = tagend + 1
+                    else:
+                        end = buffer.find(endtag, searchfrom)
+                        if end == -1:
+                            # the endtag has not been received yet, a further search
+                            # need only cover the end of this data, and the new data
+                            searchfrom = max(searchfrom, len(buffer) - len(endtag) + 1)
+                        else:
+                            end += len(endtag)
+                    if end != -1:
+                        # the message is complete, handle message here
+                        message = buffer[start:end]
+                        start = end
+                        endtag = None
+                        try:
+                            root = parse(message)
+                        except Exception as e:
+                            # failed to parse the message, continue with the next
+                            continue
+                        # record where the next call continues framing
+                        self._position = start
+                        # xml datablock done, return it
+                        return root
+            # more data is needed, first remove the data already framed
+            if start:
+                del buffer[:start]
+                if tagend != -1:
+                    tagend -= start
+                    searchfrom -= start
+                start = 0
+                self._position = 0
+            data = await datainput()
             if data is None:
                 return
             if self._stop:
                 return
-            if not message:
-                # data is expected to start with <tag, first strip any newlines
-                data = data.strip()
-                for index, st in enumerate(_STARTTAGS):
-                    if data.startswith(st):
-                        messagetagnumber = index
-                        break
-                    elif st in data:
-                        # remove any data prior to a starttag
-                        positionofst = data.index(st)
-                        data = data[positionofst:]
-                        messagetagnumber = index
-                        break
-                else:
-                    # data does not start with a recognised tag, so ignore it
-                    # and continue waiting for a valid message start
-                    continue
-                # set this data into the received message
-                message = data
-                # either further children of this tag are coming, or maybe its a single tag ending in "/>"
-                if message.endswith(b'/>'):
-                    # the message is complete, handle message here
-                    try:
-                        root = ET.fromstring(message.decode("us-ascii"))
-                    except Exception as e:
-                        # failed to parse the message, continue at beginning
-                        message = b''
-                        messagetagnumber = None
-                        continue
-                    # xml datablock done, return it
-                    return root
-                # and read either the next message, or the children of this tag
-                continue
-            # To reach this point, the message is in progress, with a messagetagnumber set
-            # keep adding the received data to message, until an endtag is reached
-            message += data
-            if message.endswith(_ENDTAGS[messagetagnumber]):
-                # the message is complete, handle message here
-                try:
-                    root = ET.fromstring(message.decode("us-ascii"))
-                except Exception as e:
-                    # failed to parse the message, continue at beginning
-                    message = b''
-                    messagetagnumber = None
-                    continue
-                # xml datablock done, return it
-                return root
-            # so message is in progress, with a messagetagnumber set
-            # but no valid endtag received yet, so continue the loop
-
+            buffer += data
 
     async def _datainput(self):
-        """Waits for binary string of data ending in > from the driver
-           Returns None if stop flags arises"""
-        remainder = self._remainder
-        if b">" in remainder:
-            # This returns with binary data ending in > as long
-            # as there are > characters in self._remainder
-            binarydata, self._remainder = remainder.split(b'>', maxsplit=1)
-            binarydata += b">"
-            return binarydata
-        # As soon as there are no > characters left in self._remainder
-        # get more data from the driver
-        while not self._stop:
-            await asyncio.sleep(0)
-            indata = await self.proc.stdout.read(100)
-            if not indata:
-                await asyncio.sleep(0.02)
-                continue
-            remainder += indata
-            if b">" in indata:
-                binarydata, self._remainder = remainder.split(b'>', maxsplit=1)
-                binarydata += b">"
-                return binarydata
+        """Waits for a block of data from the driver
+           Returns None at the end of file"""
+        data = await self.proc.stdout.read(65536)
+        if not data:
+            # end of file, the driver has closed its stdout
+            return
+        return data
 
 
     async def _run_err(self):
         """gets binary string of data from exdriver proc.stderr
            and logs it to logging.error."""
-        data = b""
         while not self._stop:
             bindata = await self.proc.stderr.readline()
             if not bindata:
-                await asyncio.sleep(0.02)
-                continue
+                # end of file, the driver has closed its stderr
+                return
             logger.error(bindata.decode('utf-8'))
 
 
@@ -1,6 +1,6 @@
 
 
-import collections, asyncio, sys, copy, time
+import collections, asyncio, sys, time, heapq
 
 from datetime import datetime, timezone
 
@@ -9,10 +9,28 @@ import xml.etree.ElementTree as ET
 import logging
 logger = logging.getLogger(__name__)
 
-from .comms import STDINOUT, Portcomms, queueget
+from .comms import STDINOUT, Portcomms, wakeque, logstring
 from . import events
 from .propertyvectors import timestamp_string
 
+# A getProperties request for all devices never changes, so a single
+# element is created here, and is sent by send_getProperties
+_GETPROPERTIES_ALL = ET.Element('getProperties', {"version":"1.7"})
+
+# the event class created for each tag of snooped data
+_SNOOPEVENTS = {"message":events.Message,
+                "delProperty":events.delProperty,
+                "defSwitchVector":events.defSwitchVector,
+                "setSwitchVector":events.setSwitchVector,
+                "defLightVector":events.defLightVector,
+                "setLightVector":events.setLightVector,
+                "defTextVector":events.defTextVector,
+                "setTextVector":events.setTextVector,
+                "defNumberVector":events.defNumberVector,
+                "setNumberVector":events.setNumberVector,
+                "defBLOBVector":events.defBLOBVector,
+                "setBLOBVector":events.setBLOBVector}
+
 
 def getfloat(value):
     """The INDI spec specifies several different number formats, given a number
@@ -131,6 +149,10 @@ class IPyDriver(collections.UserDict):
         # The coroutine _monitorsnoop Checks if current time is greater than
         # timeout+timestamp, and if it is, sends a getproperties
 
+        self._snoopheap = []
+        # a heapq of tuples (duetime, (devicename,vectorname), [timeout, timestamp])
+        # ordered by the time each snooped vector is next due to be checked
+
         self.debug_enable = False
         # If True, xmldata will be logged at DEBUG level
 
@@ -144,6 +166,31 @@ class IPyDriver(collections.UserDict):
         self._stop = False
         # shutdown routine sets this to True to stop coroutines
 
+        self._enabled_devices = None
+        # A tuple of enabled devices, used when broadcasting a getProperties
+        # to all devices. Set to None whenever a device enable attribute
+        # changes, and rebuilt when next required.
+
+        # received xml is passed to a handler according to its tag
+        self._tag_dispatch = {"getProperties":self._rx_getproperties,
+                              "enableBLOB":self._rx_client,
+                              "newSwitchVector":self._rx_client,
+                              "newNumberVector":self._rx_client,
+                              "newTextVector":self._rx_client,
+                              "newBLOBVector":self._rx_client,
+                              "message":self._rx_snoop,
+                              "delProperty":self._rx_snoop,
+                              "defSwitchVector":self._rx_snoop,
+                              "setSwitchVector":self._rx_snoop,
+                              "defLightVector":self._rx_snoop,
+                              "setLightVector":self._rx_snoop,
+                              "defTextVector":self._rx_snoop,
+                              "setTextVector":self._rx_snoop,
+                              "defNumberVector":self._rx_snoop,
+                              "setNumberVector":self._rx_snoop,
+                              "defBLOBVector":self._rx_snoop,
+                              "setBLOBVector":self._rx_snoop}
+
 
     def devices(self):
         "Returns a list of device objects"
@@ -156,6 +203,8 @@ class IPyDriver(collections.UserDict):
             self.comms.shutdown()
         for device in self.data.values():
             device.shutdown()
+        wakeque(self.readerque)
+        wakeque(self.snoopque)
 
     @property
     def stop(self):
@@ -164,6 +213,13 @@ class IPyDriver(collections.UserDict):
 
 
     async def _queueput(self, queue, value, timeout=0.5):
+        try:
+            # the queue normally has space, so put without waiting, which
+            # avoids the task created by wait_for for every put
+            queue.put_nowait(value)
+            return
+        except asyncio.QueueFull:
+            pass
         while not self._stop:
             try:
                 await asyncio.wait_for(queue.put(value), timeout)
@@ -187,82 +243,77 @@ class IPyDriver(collections.UserDict):
         "Transmits xmldata, this is an internal method, not normally called by a user."
         if not self.comms.connected:
             return
-        while not self._stop:
-            if not self.comms.connected:
-                return
-            try:
-                await asyncio.wait_for(self.writerque.put(xmldata), timeout=0.5)
-            except asyncio.TimeoutError:
-                # queue is full, continue while loop, checking stop flag
-                continue
-            break
-        if logger.isEnabledFor(logging.DEBUG) and self.debug_enable:
-            if (xmldata.tag == "setBLOBVector") and len(xmldata):
-                data = copy.deepcopy(xmldata)
-                for element in data:
-                    element.text = "NOT LOGGED"
-                binarydata = ET.tostring(data)
-                logger.debug(f"TX:: {binarydata.decode('utf-8')}")
-            else:
-                binarydata = ET.tostring(xmldata)
-                logger.debug(f"TX:: {binarydata.decode('utf-8')}")
+        try:
+            # the queue normally has space, so put without waiting
+            self.writerque.put_nowait(xmldata)
+        except asyncio.QueueFull:
+            while not self._stop:
+                if not self.comms.connected:
+                    return
+                try:
+                    await asyncio.wait_for(self.writerque.put(xmldata), timeout=0.5)
+                except asyncio.TimeoutError:
+                    # queue is full, continue while loop, checking stop flag
+                    continue
+                break
+        # the debug string is only created if it is to be logged
+        if self.debug_enable and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("TX:: %s", logstring(xmldata))
 
 
     def __setitem__(self, devicename):
         raise KeyError
 
     async def _read_readerque(self):
-        client_tags = ("enableBLOB", "newSwitchVector", "newNumberVector", "newTextVector", "newBLOBVector")
-        snoop_tags = ("message", 'delProperty', 'defSwitchVector', 'setSwitchVector', 'defLightVector',
-                      'setLightVector', 'defTextVector', 'setTextVector', 'defNumberVector', 'setNumberVector',
-                      'defBLOBVector', 'setBLOBVector')
+        # local names for attributes used in the loop
+        readerque = self.readerque
+        tag_dispatch = self._tag_dispatch
         while not self._stop:
             # reads readerque, and sends xml data to the device via its dataque
-            quexit, root = await queueget(self.readerque)
-            if quexit:
+            root = await readerque.get()
+            if root is None:
+                # sentinel value placed in the queue on shutdown
+                readerque.task_done()
                 continue
             # log the received data
-            if logger.isEnabledFor(logging.DEBUG) and self.debug_enable:
-                if ((root.tag == "setBLOBVector") or (root.tag == "newBLOBVector")) and len(root):
-                    data = copy.deepcopy(root)
-                    for element in data:
-                        element.text = "NOT LOGGED"
-                    binarydata = ET.tostring(data)
-                    logger.debug(f"RX:: {binarydata.decode('utf-8')}")
-                else:
-                    binarydata = ET.tostring(root)
-                    logger.debug(f"RX:: {binarydata.decode('utf-8')}")
-            if root.tag == "getProperties":
-                version = root.get("version")
-                if version != "1.7":
-                    self.readerque.task_done()
-                    continue
-                # getProperties received with correct version
-                devicename = root.get("device")
-                # devicename is None (for all devices), or a named device
-                if devicename is None:
-                    for d in self.data.values():
-                        if d.enable:
-                            await self._queueput(d.dataque, root)
-                elif devicename in self.data:
-                    if self.data[devicename].enable:
-                        await self._queueput(self.data[devicename].dataque, root)
-                # else device not recognised
-            elif root.tag in client_tags:
-                # xml received from client
-                devicename = root.get("device")
-                if devicename is None:
-                    # device not given, ignore this
-                    self.readerque.task_done()
-                    continue
-                elif devicename in self.data:
-                    if self.data[devicename].enable:
-                        await self._queueput(self.data[devicename].dataque, root)
-                # else device not recognised
-            elif root.tag in snoop_tags:
-                # xml received from other devices
-                await self._queueput(self.snoopque, root)
-            self.readerque.task_done()
+            if self.debug_enable and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("RX:: %s", logstring(root))
+            # get the handler for this tag, unknown tags are ignored
+            handler = tag_dispatch.get(root.tag)
+            if handler is not None:
+                await handler(root)
+            readerque.task_done()
+
+    async def _rx_getproperties(self, root):
+        "Sends a received getProperties to the device dataque"
+        if root.get("version") != "1.7":
+            return
+        # getProperties received with correct version
+        devicename = root.get("device")
+        # devicename is None (for all devices), or a named device
+        if devicename is None:
+            enabled = self._enabled_devices
+            if enabled is None:
+                enabled = tuple(d for d in self.data.values() if d.enable)
+                self._enabled_devices = enabled
+            for d in enabled:
+                await self._queueput(d.dataque, root)
+            return
+        device = self.data.get(devicename)
+        # if device is None, it is not recognised
+        if device is not None and device.enable:
+            await self._queueput(device.dataque, root)
+
+    async def _rx_client(self, root):
+        "Sends xml received from a client to the device dataque"
+        # if device is not given, or not recognised, this is ignored
+        device = self.data.get(root.get("device"))
+        if device is not None and device.enable:
+            await self._queueput(device.dataque, root)
+
+    async def _rx_snoop(self, root):
+        "xml received from other devices is passed to the snoopque"
+        await self._queueput(self.snoopque, root)
 
     async def _call_snoopevent(self, event):
         "Update timestamp when snoop data received and call self.snoopevent"
@@ -276,73 +327,34 @@ class IPyDriver(collections.UserDict):
 
     async def _snoophandler(self):
         """Creates events using data from self.snoopque"""
+        snoopque = self.snoopque
         while not self._stop:
             # get block of data from the self.snoopque
-            quexit, root = await queueget(self.snoopque)
-            if quexit:
+            root = await snoopque.get()
+            if root is None:
+                # sentinel value placed in the queue on shutdown
+                snoopque.task_done()
+                continue
+            # if a device name is given, check
+            # it is not in this drivers devices
+            if root.get("device") in self.data:
+                logger.error("Cannot snoop on a device already controlled by this driver")
+                snoopque.task_done()
+                continue
+            # get the event class for this tag, unknown tags are ignored
+            snoopevent = _SNOOPEVENTS.get(root.tag)
+            if snoopevent is None:
+                snoopque.task_done()
                 continue
-            devicename = root.get("device")
-            if devicename is not None:
-                # if a device name is given, check
-                # it is not in this drivers devices
-                if devicename in self.data:
-                    logger.error("Cannot snoop on a device already controlled by this driver")
-                    self.snoopque.task_done()
-                    continue
             try:
-                if root.tag == "message":
-                    # create event
-                    event = events.message(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "delProperty":
-                    # create event
-                    event = events.delProperty(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "defSwitchVector":
-                    # create event
-                    event = events.defSwitchVector(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "setSwitchVector":
-                    # create event
-                    event = events.setSwitchVector(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "defLightVector":
-                    # create event
-                    event = events.defLightVector(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "setLightVector":
-                    # create event
-                    event = events.setLightVector(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "defTextVector":
-                    # create event
-                    event = events.defTextVector(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "setTextVector":
-                    # create event
-                    event = events.setTextVector(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "defNumberVector":
-                    # create event
-                    event = events.defNumberVector(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "setNumberVector":
-                    # create event
-                    event = events.setNumberVector(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "defBLOBVector":
-                    # create event
-                    event = events.defBLOBVector(root)
-                    await self._call_snoopevent(event)
-                elif root.tag == "setBLOBVector":
-                    # create event
-                    event = events.setBLOBVector(root)
-                    await self._call_snoopevent(event)
+                # create event
+                event = snoopevent(root)
+                await self._call_snoopevent(event)
             except events.EventException as ex:
                 # if an EventException is raised, it is because received data is malformed
                 # so log it
                 logger.exception("An exception occurred creating a snoop event")
-            self.snoopque.task_done()
+            snoopque.task_done()
 
     async def send_message(self, message="", timestamp=None):
         "Send system wide message - without device name"
@@ -350,10 +362,10 @@ class IPyDriver(collections.UserDict):
         if not tstring:
             logger.error("The timestamp given in send_message must be a datetime.datetime UTC object")
             return
-        xmldata = ET.Element('message')
-        xmldata.set("timestamp", tstring)
         if message:
-            xmldata.set("message", message)
+            xmldata = ET.Element('message', {"timestamp":tstring, "message":message})
+        else:
+            xmldata = ET.Element('message', {"timestamp":tstring})
         await self.send(xmldata)
 
 
@@ -379,7 +391,9 @@ class IPyDriver(collections.UserDict):
 
         # set self.snoopvectors[(devicename,vectorname)] to [timeout, timestamp]
 
-        self.snoopvectors[(devicename,vectorname)] = [timeout, current - timeout + 1]
+        timedata = [timeout, current - timeout + 1]
+        self.snoopvectors[(devicename,vectorname)] = timedata
+        heapq.heappush(self._snoopheap, (current + 1, (devicename,vectorname), timedata))
 
         # setting timestamp to current - timeout + 1 means that after a second
         # the coroutine _monitorsnoop will think that its own time measurement
@@ -388,40 +402,50 @@ class IPyDriver(collections.UserDict):
 
     async def _monitorsnoop(self):
         "Checks if any snooping vectors have timed out, if it has, sends getproperties"
+        # local names for the attributes and functions used in the loop
+        snoopheap = self._snoopheap
+        snoopvectors = self.snoopvectors
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+        now = time.time
         while not self._stop:
             await asyncio.sleep(1)
-            if not self.snoopvectors:
-                continue
-            current = time.time()
-            for key, value in self.snoopvectors.items():
-                if value is None:
+            current = now()
+            # only vectors at the top of the heap, which are due, are checked
+            while snoopheap and snoopheap[0][0] <= current:
+                duetime, key, timedata = heappop(snoopheap)
+                if snoopvectors.get(key) is not timedata:
+                    # this vector has been set again by the snoop method, which has
+                    # added a new entry to the heap, so this entry is discarded
                     continue
-                timeout, timestamp = value
-                if current > timestamp + timeout:
+                timeout, timestamp = timedata
+                if current >= timestamp + timeout:
                     # the timeout has expired, update timestamp and send getproperties
-                    value[1] = current
+                    timedata[1] = current
+                    heappush(snoopheap, (current + timeout, key, timedata))
                     await self.send_getProperties(*key)
+                else:
+                    # snoop data has been received, check again when next due
+                    heappush(snoopheap, (timestamp + timeout, key, timedata))
 
 
     async def send_getProperties(self, devicename=None, vectorname=None):
         """Sends a getProperties request - which is used to snoop data from other devices
            on the network, if devicename given, it must not be a device of this driver as
            the point of this is to snoop on remote devices."""
-        xmldata = ET.Element('getProperties')
-        xmldata.set("version", "1.7")
         if devicename is None:
-            await self.send(xmldata)
+            await self.send(_GETPROPERTIES_ALL)
             self.snoopall = True
             return
         if devicename in self.data:
             logger.error("Cannot snoop on a device already controlled by this driver")
             return
-        xmldata.set("device", devicename)
         if vectorname is None:
+            xmldata = ET.Element('getProperties', {"version":"1.7", "device":devicename})
             await self.send(xmldata)
             self.snoopdevices.add(devicename)
             return
-        xmldata.set("name", vectorname)
+        xmldata = ET.Element('getProperties', {"version":"1.7", "device":devicename, "name":vectorname})
         await self.send(xmldata)
         # adds tuple (devicename,vectorname) to self.snoopvectors
         if (devicename,vectorname) not in self.snoopvectors:
@@ -521,10 +545,13 @@ class Device(collections.UserDict):
         # This device name
         self.devicename = devicename
 
+        # this will be set when the driver asyncrun is run
+        self.driver = None
+
         # if self.enable is False, this device ignores incoming traffic
         # and (apart from delProperty) does not transmit anything
         # from his device
-        self.enable = True
+        self._enable = True
 
         # the driver places data in this que to send data to this device
         self.dataque = asyncio.Queue(4)
@@ -535,9 +562,6 @@ class Device(collections.UserDict):
         # dictionary of optional data
         self.devicedata = devicedata
 
-        # this will be set when the driver asyncrun is run
-        self.driver = None
-
         # self.data is a dictionary of name to vector this device owns
         for p in properties:
             p.devicename = self.devicename
@@ -547,6 +571,19 @@ class Device(collections.UserDict):
         self._stop = False
 
 
+    @property
+    def enable(self):
+        "If False, this device ignores incoming traffic, and does not transmit"
+        return self._enable
+
+    @enable.setter
+    def enable(self, value):
+        self._enable = value
+        if self.driver is not None:
+            # the driver rebuilds its tuple of enabled devices when next required
+            self.driver._enabled_devices = None
+
+
     def properties(self):
         "Returns a list of vector objects"
         return list(self.data.values())
@@ -558,6 +595,7 @@ class Device(collections.UserDict):
         self._stop = True
         for pv in self.data.values():
             pv.shutdown()
+        wakeque(self.dataque)
 
     @property
     def stop(self):
@@ -566,6 +604,13 @@ class Device(collections.UserDict):
 
 
     async def _queueput(self, queue, value, timeout=0.5):
+        try:
+            # the queue normally has space, so put without waiting, which
+            # avoids the task created by wait_for for every put
+            queue.put_nowait(value)
+            return
+        except asyncio.QueueFull:
+            pass
         while not self._stop:
             try:
                 await asyncio.wait_for(queue.put(value), timeout)
@@ -585,11 +630,10 @@ class Device(collections.UserDict):
         if not tstring:
             logger.error("The timestamp given in send_device_message must be a datetime.datetime UTC object")
             return
-        xmldata = ET.Element('message')
-        xmldata.set("device", self.devicename)
-        xmldata.set("timestamp", tstring)
         if message:
-            xmldata.set("message", message)
+            xmldata = ET.Element('message', {"device":self.devicename, "timestamp":tstring, "message":message})
+        else:
+            xmldata = ET.Element('message', {"device":self.devicename, "timestamp":tstring})
         await self.driver.send(xmldata)
 
     async def send_delProperty(self, message="", timestamp=None):
@@ -604,11 +648,10 @@ class Device(collections.UserDict):
         if not tstring:
             logger.error("The timestamp given in send_delProperty must be a datetime.datetime UTC object")
             return
-        xmldata = ET.Element('delProperty')
-        xmldata.set("device", self.devicename)
-        xmldata.set("timestamp", tstring)
         if message:
-            xmldata.set("message", message)
+            xmldata = ET.Element('delProperty', {"device":self.devicename, "timestamp":tstring, "message":message})
+        else:
+            xmldata = ET.Element('delProperty', {"device":self.devicename, "timestamp":tstring})
         await self.driver.send(xmldata)
         self.enable = False
 
@@ -642,54 +685,40 @@ class Device(collections.UserDict):
 
     async def _handler(self):
         """Handles data read from dataque"""
+        # local names for attributes used in the loop
+        dataque = self.dataque
+        vectors = self.data
+        queueput = self._queueput
         while not self._stop:
             # get block of data from the self.dataque
-            quexit, root = await queueget(self.dataque)
-            if quexit:
+            root = await dataque.get()
+            if root is None:
+                # sentinel value placed in the queue on shutdown
+                dataque.task_done()
                 continue
-            if not self.enable:
-                self.dataque.task_done()
+            if not self._enable:
+                dataque.task_done()
                 continue
-            if root.tag == "getProperties":
-                name = root.get("name")
-                # name is None (for all properties), or a named property
-                if name is None:
-                    for pvector in self.data.values():
-                        if pvector.enable:
-                            await self._queueput(pvector.dataque, root)
-                elif name in self.data:
-                    if self.data[name].enable:
-                        await self._queueput(self.data[name].dataque, root)
-                else:
-                    # property name not recognised
-                    self.dataque.task_done()
-                    continue
-            elif root.tag == "enableBLOB":
-                name = root.get("name")
+            name = root.get("name")
+            tag = root.tag
+            if tag == "getProperties" or tag == "enableBLOB":
                 # name is None (for all properties), or a named property
                 if name is None:
-                    for pvector in self.data.values():
+                    for pvector in vectors.values():
                         if pvector.enable:
-                            await self._queueput(pvector.dataque, root)
-                elif name in self.data:
-                    if self.data[name].enable:
-                        await self._queueput(self.data[name].dataque, root)
+                            await queueput(pvector.dataque, root)
                 else:
-                    # property name not recognised
-                    self.dataque.task_done()
-                    continue
+                    pvector = vectors.get(name)
+                    # if pvector is None, the property name is not recognised
+                    if pvector is not None and pvector.enable:
+                        await queueput(pvector.dataque, root)
             else:
                 # root.tag will be one of
                 # newSwitchVector, newNumberVector, newTextVector, newBLOBVector
-                name = root.get("name")
-                if name is None:
-                    # name not given, ignore this
-                    self.dataque.task_done()
-                    continue
-                elif name in self.data:
-                    pvector = self.data[name]
-                    if pvector.perm != "ro" and pvector.enable:
-                        # all ok, add to the vector dataque
-                        await self._queueput(pvector.dataque, root)
+                # if name is not given, or not recognised, this is ignored
+                pvector = vectors.get(name)
+                if pvector is not None and pvector.perm != "ro" and pvector.enable:
+                    # all ok, add to the vector dataque
+                    await queueput(pvector.dataque, root)
             # task completed
-            self.dataque.task_done()
+            dataque.task_done()
@@ -1,6 +1,6 @@
 
 
-import collections, asyncio, sys, copy
+import collections, asyncio, sys
 
 from datetime import datetime, timezone
 
@@ -13,7 +13,7 @@ logger = logging.getLogger(__name__)
 
 from .ipydriver import IPyDriver
 
-from .comms import Port_RX, Port_TX, cleanque, SendChecker, queueget
+from .comms import Port_RX, Port_TX, cleanque, SendChecker, wakeque, logstring, tobytes
 
 from .remote import RemoteConnection
 
@@ -130,8 +130,18 @@ class IPyServer:
             clientconnection.shutdown()
         if not self.server is None:
             self.server.close()
+        # wake _copyfromserver and _sendtoclient, so they can check self._stop
+        wakeque(self.serverreaderque)
+        wakeque(self.serverwriterque)
 
     async def _queueput(self, queue, value, timeout=0.5):
+        try:
+            # the queue normally has space, so put without waiting, which
+            # avoids the task created by wait_for for every put
+            queue.put_nowait(value)
+            return
+        except asyncio.QueueFull:
+            pass
         while not self._stop:
             try:
                 await asyncio.wait_for(queue.put(value), timeout)
@@ -250,29 +260,36 @@ class IPyServer:
         """Gets data from serverreaderque.
            For every driver, copy data, if applicable, to driver.readerque
            And for every remote connection if applicable, to its send method"""
+        serverreaderque = self.serverreaderque
         while not self._stop:
-            quexit, xmldata = await queueget(self.serverreaderque)
-            if quexit:
+            xmldata = await serverreaderque.get()
+            if xmldata is None:
+                # sentinel value placed in the queue on shutdown
+                serverreaderque.task_done()
                 continue
             devicename = xmldata.get("device")
             propertyname = xmldata.get("name")
-
-            if logger.isEnabledFor(logging.DEBUG) and self.debug_enable:
-                if ((xmldata.tag == "setBLOBVector") or (xmldata.tag == "newBLOBVector")) and len(xmldata):
-                    data = copy.deepcopy(xmldata)
-                    for element in data:
-                        element.text = "NOT LOGGED"
-                    binarydata = ET.tostring(data)
-                    logger.debug(f"RX:: {binarydata.decode('utf-8')}")
-                else:
-                    binarydata = ET.tostring(xmldata)
-                    logger.debug(f"RX:: {binarydata.decode('utf-8')}")
+            # the tag tests used for routing, made once for each message
+            tag = xmldata.tag
+            isgetproperties = (tag == "getProperties")
+            isnew = tag.startswith("new")
+
+            if self.debug_enable and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("RX:: %s", logstring(xmldata))
+
+            if devicename in self.devices and isnew:
+                # the usual client traffic, a 'new' vector for a device of an attached
+                # driver, this is not snoopable, so is sent only to that driver without
+                # scanning the remotes, exdrivers and drivers
+                await self._queueput(self.devices[devicename].driver.readerque, xmldata)
+                self.serverreaderque.task_done()
+                continue
 
             remconfound = False
             exdriverfound = False
 
             # check for a getProperties
-            if xmldata.tag == "getProperties":
+            if isgetproperties:
                 # if getproperties is targetted at a known device, send it to that device
                 if devicename:
                     if devicename in self.devices:
@@ -307,7 +324,7 @@ class IPyServer:
 
 
             # transmit xmldata out to remote connections
-            if xmldata.tag != "enableBLOB":
+            if tag != "enableBLOB":
                 # enableBLOB instructions are not forwarded to remcon's
                 for remcon in self.remotes:
                     if not remcon.connected:
@@ -319,12 +336,12 @@ class IPyServer:
                         await remcon.send(xmldata)
                         remconfound = True
                         break
-                    elif xmldata.tag == "getProperties":
+                    elif isgetproperties:
                         # either no devicename, or an unknown device
                         # if it were a known devicename the previous block would have handled it.
                         # so send it on all connections
                         await remcon.send(xmldata)
-                    elif not xmldata.tag.startswith("new"):
+                    elif not isnew:
                         # either devicename is unknown, or this data is to/from another driver.
                         # So check if this remcon is snooping on this device/vector
                         # only forward def's and set's, not 'new' vectors which
@@ -342,7 +359,7 @@ class IPyServer:
                 continue
 
             # transmit xmldata out to exdrivers
-            if xmldata.tag != "enableBLOB":
+            if tag != "enableBLOB":
                 # enableBLOB instructions are not forwarded to external drivers
                 for driver in self.exdrivers:
                     if devicename and (devicename in driver):
@@ -351,10 +368,10 @@ class IPyServer:
                         await self._queueput(driver.readerque, xmldata)
                         exdriverfound = True
                         break
-                    elif xmldata.tag == "getProperties":
+                    elif isgetproperties:
                         # either no devicename, or an unknown device
                         await self._queueput(driver.readerque, xmldata)
-                    elif not xmldata.tag.startswith("new"):
+                    elif not isnew:
                         # either devicename is unknown, or this data is to/from another driver.
                         # So check if this driver is snooping on this device/vector
                         # only forward def's and set's, not 'new' vectors which
@@ -378,10 +395,10 @@ class IPyServer:
                     # it is not snoopable, since it is data to a device, not from it.
                     await self._queueput(driver.readerque, xmldata)
                     break
-                elif xmldata.tag == "getProperties":
+                elif isgetproperties:
                     # either no devicename, or an unknown device
                     await self._queueput(driver.readerque, xmldata)
-                elif not xmldata.tag.startswith("new"):
+                elif not isnew:
                     # either devicename is unknown, or this data is to/from another driver.
                     # So check if this driver is snooping on this device/vector
                     # only forward def's and set's, not 'new' vectors which
@@ -398,30 +415,35 @@ class IPyServer:
 
     async def _sendtoclient(self):
         "For every clientconnection, get txque and copy data into it from serverwriterque"
+        serverwriterque = self.serverwriterque
         while not self._stop:
-            quexit, xmldata = await queueget(self.serverwriterque)
-            if quexit:
-                continue
-            #  This xmldata of None is an indication to shut the server down
+            xmldata = await serverwriterque.get()
+            if xmldata is None and self._stop:
+                # sentinel value placed in the queue on shutdown
+                serverwriterque.task_done()
+                return
+            #  Otherwise this xmldata of None is an indication to shut the server down
             #  It is set to None when a duplicate devicename is discovered
             if xmldata is None:
                 logger.error("A duplicate devicename has caused a server shutdown")
                 self.serverwriterque.task_done()
                 self.shutdown("A duplicate devicename has caused a server shutdown")
                 return
-            if logger.isEnabledFor(logging.DEBUG) and self.debug_enable:
-                if (xmldata.tag == "setBLOBVector") and len(xmldata):
-                    data = copy.deepcopy(xmldata)
-                    for element in data:
-                        element.text = "NOT LOGGED"
-                    binarydata = ET.tostring(data)
-                    logger.debug(f"TX:: {binarydata.decode('utf-8')}")
-                else:
-                    binarydata = ET.tostring(xmldata)
-                    logger.debug(f"TX:: {binarydata.decode('utf-8')}")
-            for clientconnection in self.connectionpool:
-                if clientconnection.connected:
-                    await self._queueput(clientconnection.txque, xmldata)
+            if self.debug_enable and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("TX:: %s", logstring(xmldata))
+            connections = [clientconnection for clientconnection in self.connectionpool if clientconnection.connected]
+            # count the connections which will transmit this data, so it is only
+            # serialised here if it is wanted by more than one, otherwise such as a
+            # BLOB not enabled on the connections, is never serialised
+            allowedcount = 0
+            for clientconnection in connections:
+                if clientconnection.sendchecker.allowed(xmldata):
+                    allowedcount += 1
+            if allowedcount > 1:
+                # serialise the data once, rather than in each connection
+                xmldata = (xmldata, tobytes(xmldata))
+            for clientconnection in connections:
+                await self._queueput(clientconnection.txque, xmldata)
             # task completed
             self.serverwriterque.task_done()
 
@@ -442,9 +464,7 @@ class IPyServer:
                 else:
                     # invalid timestamp
                     return
-        xmldata = ET.Element('message')
-        xmldata.set("timestamp", timestamp.isoformat(sep='T'))
-        xmldata.set("message", message)
+        xmldata = ET.Element('message', {"timestamp":timestamp.isoformat(sep='T'), "message":message})
         for clientconnection in self.connectionpool:
             if clientconnection.connected:
                 # at least one is connected, so this data is put into
@@ -479,6 +499,7 @@ class _DriverComms:
         # self.remotes is a list of connections to remote servers
         self.remotes = remotes
         self._stop = False       # Gets set to True to stop communications
+        self._writerque = None   # Set by __call__, so shutdown can wake it
 
     @property
     def stop(self):
@@ -488,8 +509,17 @@ class _DriverComms:
     def shutdown(self):
         "Sets self.stop to True and calls shutdown on tasks"
         self._stop = True
+        if self._writerque is not None:
+            wakeque(self._writerque)
 
     async def _queueput(self, queue, value, timeout=0.5):
+        try:
+            # the queue normally has space, so put without waiting, which
+            # avoids the task created by wait_for for every put
+            queue.put_nowait(value)
+            return
+        except asyncio.QueueFull:
+            pass
         while not self._stop:
             try:
                 await asyncio.wait_for(queue.put(value), timeout)
@@ -501,22 +531,29 @@ class _DriverComms:
     async def __call__(self, readerque, writerque):
         """Called by the driver, should run continuously.
            reads writerque from the driver, and sends xml data to the network"""
+        self._writerque = writerque
         while not self._stop:
-            quexit, xmldata = await queueget(writerque)
-            if quexit:
+            xmldata = await writerque.get()
+            if xmldata is None:
+                # sentinel value placed in the queue on shutdown
+                writerque.task_done()
                 continue
             # Check if other drivers/remotes wants to snoop this traffic
             devicename = xmldata.get("device")
             propertyname = xmldata.get("name")
+            tag = xmldata.tag
 
-            if xmldata.tag.startswith("new"):
+            if tag.startswith("new"):
                 # drivers should never transmit a new
                 # but just in case
                 writerque.task_done()
-                logger.error(f"Driver transmitted invalid tag {xmldata.tag}")
+                logger.error(f"Driver transmitted invalid tag {tag}")
                 continue
 
-            if xmldata.tag.startswith("def"):
+            # the getProperties test is used for routing, made once for each message
+            isgetproperties = (tag == "getProperties")
+
+            if tag.startswith("def"):
                 # check for duplicate devicename
                 for driver in self.alldrivers:
                     if driver is self.driver:
@@ -528,7 +565,7 @@ class _DriverComms:
                         return
 
             # check for a getProperties
-            if xmldata.tag == "getProperties":
+            if isgetproperties:
                 foundflag = False
                 # if getproperties is targetted at a known device, send it to that device
                 if devicename:
@@ -560,7 +597,7 @@ class _DriverComms:
 
             # transmit xmldata out to remote connections
             for remcon in self.remotes:
-                if xmldata.tag == "getProperties":
+                if isgetproperties:
                     # either no devicename, or an unknown device
                     # if it were a known devicename the previous block would have handled it.
                     # so send it on all connections
@@ -578,7 +615,7 @@ class _DriverComms:
             for driver in self.alldrivers:
                 if driver is self.driver:
                     continue
-                if xmldata.tag == "getProperties":
+                if isgetproperties:
                     # either no devicename, or an unknown device
                     await self._queueput(driver.readerque, xmldata)
                 else:
@@ -626,6 +663,8 @@ class _ClientConnection:
 
         self.rx = None
         self.tx = None
+        # set to the SendChecker of the current connection
+        self.sendchecker = None
 
         self._stop = False       # Gets set to True to stop communications
 
@@ -646,10 +685,10 @@ class _ClientConnection:
     async def handle_data(self, reader, writer):
         "Used by asyncio.start_server, called to handle a client connection"
         self.connected = True
-        sendchecker = SendChecker(self.devices, self.exdrivers, self.remotes)
+        self.sendchecker = SendChecker(self.devices, self.exdrivers, self.remotes)
         addr = writer.get_extra_info('peername')
-        self.rx = Port_RX(sendchecker, reader)
-        self.tx = Port_TX(sendchecker, writer)
+        self.rx = Port_RX(self.sendchecker, reader)
+        self.tx = Port_TX(self.sendchecker, writer)
         logger.info(f"Connection received from {addr}")
         try:
             txtask = asyncio.create_task(self.tx.run_tx(self.txque))
@@ -663,7 +702,5 @@ class _ClientConnection:
             rxtask.cancel()
         cleanque(self.txque)
         logger.info(f"Connection from {addr} closed")
-        while True:
-            if txtask.done() and rxtask.done():
-                break
-            await asyncio.sleep(1)
+        # wait for both tasks to finish their cancellation
+        await asyncio.gather(txtask, rxtask, return_exceptions=True)
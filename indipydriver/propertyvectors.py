@@ -13,7 +13,7 @@ logger = logging.getLogger(__name__)
 from .events import EventException, getProperties, newSwitchVector, newTextVector, newBLOBVector, enableBLOB, newNumberVector
 from .propertymembers import SwitchMember, LightMember, TextMember, NumberMember, BLOBMember
 
-from .comms import queueget
+from .comms import wakeque
 
 
 def timestamp_string(timestamp = None):
@@ -66,6 +66,7 @@ class PropertyVector(collections.UserDict):
     def shutdown(self):
         """Sets the flag self._stop to True which shuts down the handler"""
         self._stop = True
+        wakeque(self.dataque)
 
     @property
     def stop(self):
@@ -90,12 +91,11 @@ class PropertyVector(collections.UserDict):
         if not tstring:
             logger.error("Aborting sending delProperty: The given send_delProperty timestamp must be a UTC datetime.datetime object")
             return
-        xmldata = ET.Element('delProperty')
-        xmldata.set("device", self.devicename)
-        xmldata.set("name", self.name)
-        xmldata.set("timestamp", tstring)
         if message:
-            xmldata.set("message", message)
+            xmldata = ET.Element('delProperty', {"device":self.devicename, "name":self.name,
+                                                 "timestamp":tstring, "message":message})
+        else:
+            xmldata = ET.Element('delProperty', {"device":self.devicename, "name":self.name, "timestamp":tstring})
         await self.driver.send(xmldata)
         self.enable = False
         for member in self.data.values():
@@ -214,8 +214,10 @@ class SwitchVector(PropertyVector):
         """Check received data and take action"""
         while not self._stop:
             try:
-                quexit, root = await queueget(self.dataque)
-                if quexit:
+                root = await self.dataque.get()
+                if root is None:
+                    # sentinel value placed in the queue on shutdown
+                    self.dataque.task_done()
                     continue
                 if root.tag == "getProperties":
                     # create event
@@ -406,8 +408,10 @@ class LightVector(PropertyVector):
         while not self._stop:
             # test if any xml data has been received
             try:
-                quexit, root = await queueget(self.dataque)
-                if quexit:
+                root = await self.dataque.get()
+                if root is None:
+                    # sentinel value placed in the queue on shutdown
+                    self.dataque.task_done()
                     continue
                 if root.tag == "getProperties":
                     # create event
@@ -573,8 +577,10 @@ class TextVector(PropertyVector):
         """Check received data and take action"""
         while not self._stop:
             try:
-                quexit, root = await queueget(self.dataque)
-                if quexit:
+                root = await self.dataque.get()
+                if root is None:
+                    # sentinel value placed in the queue on shutdown
+                    self.dataque.task_done()
                     continue
                 if root.tag == "getProperties":
                     # create event
@@ -757,8 +763,10 @@ class NumberVector(PropertyVector):
         """Check received data and take action"""
         while not self._stop:
             try:
-                quexit, root = await queueget(self.dataque)
-                if quexit:
+                root = await self.dataque.get()
+                if root is None:
+                    # sentinel value placed in the queue on shutdown
+                    self.dataque.task_done()
                     continue
                 if root.tag == "getProperties":
                     # create event
@@ -955,8 +963,10 @@ class BLOBVector(PropertyVector):
         """Check received data and take action"""
         while not self._stop:
             try:
-                quexit, root = await queueget(self.dataque)
-                if quexit:
+                root = await self.dataque.get()
+                if root is None:
+                    # sentinel value placed in the queue on shutdown
+                    self.dataque.task_done()
                     continue
                 if root.tag == "getProperties":
                     # create event
@@ -1,6 +1,6 @@
 
 
-import os, sys, collections, asyncio, time, copy, json, pathlib
+import os, sys, collections, asyncio, time, copy, json, pathlib, re
 
 from time import sleep
 
@@ -32,22 +32,35 @@ TAGS = (b'message',
         b'getProperties'       # for snooping
        )
 
-DEFTAGS = ( 'defSwitchVector',
-            'defLightVector',
-            'defTextVector',
-            'defNumberVector',
-            'defBLOBVector'
-          )
+DEFTAGS = frozenset(( 'defSwitchVector',
+                      'defLightVector',
+                      'defTextVector',
+                      'defNumberVector',
+                      'defBLOBVector'
+                   ))
 
 
 
 
-# _STARTTAGS is a tuple of ( b'<defTextVector', ...  ) data received will be tested to start with such a starttag
-_STARTTAGS = tuple(b'<' + tag for tag in TAGS)
-
 # _ENDTAGS is a tuple of ( b'</defTextVector>', ...  ) data received will be tested to end with such an endtag
 _ENDTAGS = tuple(b'</' + tag + b'>' for tag in TAGS)
 
+# _TAGINDEX is a dictionary of {b'defTextVector':index, ...} where index is the position of the tag in TAGS
+_TAGINDEX = {tag:index for index, tag in enumerate(TAGS)}
+
+# _STARTSEARCH finds the first recognised start tag, being < followed by one
+# of the TAGS, and then whitespace, / or >
+_STARTSEARCH = re.compile(b'<(' + b'|'.join(re.escape(tag) for tag in TAGS) + rb')[\s/>]').search
+
+
+def _findstart(data):
+    """Returns (position, index) of the first recognised start tag in data,
+       where index is the position of the tag in TAGS, or (-1, None) if not found"""
+    match = _STARTSEARCH(data)
+    if match is None:
+        return -1, None
+    return match.start(), _TAGINDEX[match.group(1)]
+
 
 
 def _makestart(element):
@@ -329,7 +342,7 @@ Setting it to None will transmit an enableBLOB for all devices set to the enable
                 return
             timestamp = datetime.now(tz=timezone.utc)
             timestamp = timestamp.replace(tzinfo=None)
-            root = ET.fromstring(f"<message timestamp=\"{timestamp.isoformat(sep='T')}\" message=\"{message}\" />")
+            root = ET.Element('message', {"timestamp":timestamp.isoformat(sep='T'), "message":message})
             # and place root into readerque
             await self.queueput(self._readerque, root)
         except Exception :
@@ -348,7 +361,7 @@ Setting it to None will transmit an enableBLOB for all devices set to the enable
                 return
             timestamp = datetime.now(tz=timezone.utc)
             timestamp = timestamp.replace(tzinfo=None)
-            root = ET.fromstring(f"<message timestamp=\"{timestamp.isoformat(sep='T')}\" message=\"{message}\" />")
+            root = ET.Element('message', {"timestamp":timestamp.isoformat(sep='T'), "message":message})
             # and place root into readerque
             await self.queueput(self._readerque, root)
         except Exception :
@@ -397,16 +410,10 @@ Setting it to None will transmit an enableBLOB for all devices set to the enable
                     logger.exception(f"Connection Error on {self.indihost}:{self.indiport}")
                     await self.warning("Connection failed")
                 self._clear_connection()
-                # connection has failed, ensure all tasks are done
-                if t1:
-                    while not t1.done():
-                        await asyncio.sleep(0)
-                if t2:
-                    while not t2.done():
-                        await asyncio.sleep(0)
-                if t3:
-                    while not t3.done():
-                        await asyncio.sleep(0)
+                # connection has failed, wait until all tasks are done
+                tasks = [t for t in (t1, t2, t3) if t]
+                if tasks:
+                    await asyncio.wait(tasks)
                 if self._stop:
                     break
                 else:
@@ -573,10 +580,10 @@ Setting it to None will transmit an enableBLOB for all devices set to the enable
     async def _xmlinput(self, reader):
         """get received data, parse it, and return it as xml.etree.ElementTree object
            Returns None if notconnected/stop flags arises"""
-        message = b''
+        # the message is accumulated in a bytearray, which is extended in place
+        message = bytearray()
         messagetagnumber = None
         while self.connected and (not self._stop):
-            await asyncio.sleep(0)
             data = await self._datainput(reader)
             # data is either None, or binary data ending in b">"
             if data is None:
@@ -586,32 +593,28 @@ Setting it to None will transmit an enableBLOB for all devices set to the enable
             if self._stop:
                 return
             if not message:
-                # data is expected to start with <tag, first strip any newlines
-                data = data.strip()
-                for index, st in enumerate(_STARTTAGS):
-                    if data.startswith(st):
-                        messagetagnumber = index
-                        break
-                    elif st in data:
-                        # remove any data prior to a starttag
-                        positionofst = data.index(st)
-                        data = data[positionofst:]
-                        messagetagnumber = index
-                        break
-                else:
-                    # data does not start with a recognised tag, so ignore it
+                # data is expected to start with <tag, any preceding newlines
+                # or other characters are removed when the starttag is found
+                positionofst, messagetagnumber = _findstart(data)
+                if positionofst == -1:
+                    # data does not contain a recognised tag, so ignore it
                     # and continue waiting for a valid message start
                     continue
+                if positionofst:
+                    # remove any data prior to a starttag
+                    data = data[positionofst:]
+                # the endtag which will complete this message
+                endtag = _ENDTAGS[messagetagnumber]
                 # set this data into the received message
-                message = data
+                message += data
                 # either further children of this tag are coming, or maybe its a single tag ending in "/>"
                 if message.endswith(b'/>'):
                     # the message is complete, handle message here
                     try:
-                        root = ET.fromstring(message.decode("us-ascii"))
+                        root = ET.fromstring(message)
                     except ET.ParseError as e:
                        # failed to parse the message, continue at beginning
-                        message = b''
+                        message.clear()
                         messagetagnumber = None
                         continue
                     # xml datablock done, return it
@@ -621,13 +624,14 @@ Setting it to None will transmit an enableBLOB for all devices set to the enable
             # To reach this point, the message is in progress, with a messagetagnumber set
             # keep adding the received data to message, until an endtag is reached
             message += data
-            if message.endswith(_ENDTAGS[messagetagnumber]):
+            # data always ends with >, so a complete endtag is within this data
+            if data.endswith(endtag):
                 # the message is complete, handle message here
                 try:
-                    root = ET.fromstring(message.decode("us-ascii"))
+                    root = ET.fromstring(message)
                 except ET.ParseError as e:
                     # failed to parse the message, continue at beginning
-                    message = b''
+                    message.clear()
                     messagetagnumber = None
                     continue
                 # xml datablock done, return it
@@ -639,15 +643,16 @@ Setting it to None will transmit an enableBLOB for all devices set to the enable
     async def _datainput(self, reader):
         """Waits for binary string of data ending in > from the port
            Returns None if notconnected/stop flags arises"""
-        binarydata = b""
+        # a long block of data, such as a BLOB, arrives in several parts,
+        # which are accumulated in a bytearray, extended in place
+        binarydata = bytearray()
         while self.connected and (not self._stop):
-            await asyncio.sleep(0)
             try:
                 data = await reader.readuntil(separator=b'>')
             except asyncio.LimitOverrunError:
                 data = await reader.read(n=32000)
             except asyncio.IncompleteReadError:
-                binarydata = b""
+                binarydata.clear()
                 await asyncio.sleep(0.1)
                 continue
             if not data:
@@ -657,8 +662,11 @@ Setting it to None will transmit an enableBLOB for all devices set to the enable
             self.tx_timer = None
             self.idle_timer = time.time()
             if b">" in data:
-                binarydata = binarydata + data
-                return binarydata
+                if binarydata:
+                    binarydata += data
+                    return binarydata
+                # normally the data arrives in one part, which is returned as it is
+                return data
             # data has content but no > found
             binarydata += data
             # could put a max value here to stop this increasing indefinetly
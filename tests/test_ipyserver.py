@@ -0,0 +1,77 @@
+
+import asyncio
+
+import xml.etree.ElementTree as ET
+
+import indipydriver as ipd
+from indipydriver import ipyserver
+from indipydriver.comms import SendChecker
+
+
+def _makeserver():
+    "Returns an IPyServer with a driver having a device with a BLOB vector"
+    bm = ipd.BLOBMember(name="b1", blobformat=".bin")
+    bv = ipd.BLOBVector(name="bv", label="BV", group="G", perm="rw", state="Ok", blobmembers=[bm])
+    nm = ipd.NumberMember(name="n1", format="%.2f", min=0, max=1000, membervalue=1)
+    nv = ipd.NumberVector(name="nv", label="NV", group="G", perm="rw", state="Ok", numbermembers=[nm])
+    driver = ipd.IPyDriver(ipd.Device("DevA", [bv, nv]))
+    return ipyserver.IPyServer(driver, maxconnections=3)
+
+
+def _sendtoclients(monkeypatch, xmldata, clients=2):
+    """Runs IPyServer._sendtoclient with the given number of connected clients,
+       none of which have sent an enableBLOB, and returns the list of elements
+       serialised by _sendtoclient, and the data placed in each client txque"""
+    serialised = []
+    def tobytes(element):
+        serialised.append(element)
+        return ET.tostring(element)
+    monkeypatch.setattr(ipyserver, "tobytes", tobytes)
+
+    async def run():
+        server = _makeserver()
+        server.debug_enable = False
+        connections = server.connectionpool[:clients]
+        for clientconnection in connections:
+            # connected, but no enableBLOB received
+            clientconnection.connected = True
+            clientconnection.sendchecker = SendChecker(server.devices)
+        task = asyncio.create_task(server._sendtoclient())
+        await server.serverwriterque.put(xmldata)
+        await server.serverwriterque.join()
+        server.shutdown()
+        await task
+        return [clientconnection.txque.get_nowait() for clientconnection in connections]
+
+    txdata = asyncio.run(run())
+    return serialised, txdata
+
+
+def test_blob_not_serialised_when_not_enabled(monkeypatch):
+    "A setBLOBVector is not serialised for clients that have not enabled BLOBs"
+    xmldata = ET.Element("setBLOBVector", {"device":"DevA", "name":"bv"})
+    oneblob = ET.SubElement(xmldata, "oneBLOB", {"name":"b1", "size":"3", "format":".bin"})
+    oneblob.text = "QUJD" * 100000
+    serialised, txdata = _sendtoclients(monkeypatch, xmldata)
+    assert serialised == []
+    # each client is given the element, which its Port_TX will discard
+    assert txdata == [xmldata, xmldata]
+
+
+def test_allowed_data_serialised_once(monkeypatch):
+    "Data allowed by several clients is serialised once and shared"
+    xmldata = ET.Element("setNumberVector", {"device":"DevA", "name":"nv"})
+    ET.SubElement(xmldata, "oneNumber", {"name":"n1"}).text = "2"
+    serialised, txdata = _sendtoclients(monkeypatch, xmldata)
+    assert serialised == [xmldata]
+    assert txdata[0] is txdata[1]
+    assert txdata[0] == (xmldata, ET.tostring(xmldata))
+
+
+def test_single_client_not_serialised(monkeypatch):
+    "With one client, the element is passed for that client's Port_TX to serialise"
+    xmldata = ET.Element("setNumberVector", {"device":"DevA", "name":"nv"})
+    ET.SubElement(xmldata, "oneNumber", {"name":"n1"}).text = "2"
+    serialised, txdata = _sendtoclients(monkeypatch, xmldata, clients=1)
+    assert serialised == []
+    assert txdata == [xmldata]